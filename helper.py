@@ -1,4 +1,5 @@
 import logging
+import statistics
 import time
 from typing import List
 from optibook import common_types as t
@@ -8,7 +9,7 @@ from optibook.synchronous_client import Exchange
 import random
 import json
 
-INSTRUMENT_IDS = ['SEMIS_ETF_US', 'SEMIS_ETF_EU', 'NVDA', 'AMD', 'ASML']
+INSTRUMENT_IDS = ('SEMIS_ETF_US', 'SEMIS_ETF_EU', 'NVDA', 'AMD', 'ASML')
 
 logging.getLogger('client').setLevel('ERROR')
 logger = logging.getLogger(__name__)
@@ -18,23 +19,22 @@ def is_up(priceBook) -> bool:
 
 def print_order_response(order_response: InsertOrderResponse):
     if order_response.success:
-        logger.info(f"Inserted order successfully, order_id='{order_response.order_id}'")
+        logger.info("Inserted order successfully, order_id='%s'", order_response.order_id)
     else:
-        logger.info(f"Unable to insert order with reason: '{order_response.success}'")
+        logger.info("Unable to insert order with reason: '%s'", order_response.success)
 
 def print_all_responses(reponses):
     for response in reponses:
         print_order_response(response)
 
-def clear_excess_stock(e: Exchange): 
+# Closes every position of at least min_abs lots (all of them by default) with limit orders at the top of the book
+def clear_stock(e: Exchange, min_abs=0):
     positions = e.get_positions()
     for id in INSTRUMENT_IDS:
         pb = e.get_last_price_book(id)
         if (not is_up(pb)):
             continue
-        # print(pb)
-        # print(positions[id])
-        if positions[id] == 0 or abs(positions[id]) < 500:
+        if positions[id] == 0 or abs(positions[id]) < min_abs:
             continue
         # We've sold too much, need to buy back 
         if positions[id] < 0:
@@ -42,23 +42,7 @@ def clear_excess_stock(e: Exchange):
         else:
             e.insert_order(id, price=pb.bids[0].price, volume=positions[id], side=SIDE_ASK, order_type=ORDER_TYPE_LIMIT)
 
-def clear_all_stock(e: Exchange): 
-    positions = e.get_positions()
-    for id in INSTRUMENT_IDS:
-        pb = e.get_last_price_book(id)
-        if (not is_up(pb)):
-            continue
-        # print(pb)
-        # print(positions[id])
-        if positions[id] == 0:
-            continue
-        # We've sold too much, need to buy back 
-        if positions[id] < 0:
-            e.insert_order(id, price=pb.asks[0].price, volume=abs(positions[id]), side=SIDE_BID, order_type=ORDER_TYPE_LIMIT)
-        else:
-            e.insert_order(id, price=pb.bids[0].price, volume=positions[id], side=SIDE_ASK, order_type=ORDER_TYPE_LIMIT)
-
-# Returns 10% low and 10% of average of last 10s of data
+# Returns 10% low and 10% of average of last 10s of data (None for an instrument that was never up)
 def calc_range(e: Exchange): 
     cache_asks = {'SEMIS_ETF_US': [],
              'SEMIS_ETF_EU': [],
@@ -84,17 +68,16 @@ def calc_range(e: Exchange):
         time.sleep(sleep_time)
     print("finished collecting data")
 
-    for key in cache_asks.keys():
-        data = cache_asks[key]
-        sorted_data = sorted(data)
-        low_index = int(len(sorted_data) * 0.1)
-        high_index = int(len(sorted_data) * 0.9)
-        cache_asks[key] = (cache_asks[key][low_index], cache_asks[key][high_index])
-    for key in cache_bids.keys():
-        data = cache_bids[key]
-        sorted_data = sorted(data)
-        low_index = int(len(sorted_data) * 0.1)
-        high_index = int(len(sorted_data) * 0.9)
-        cache_bids[key] = (cache_bids[key][low_index], cache_bids[key][high_index])
+    for cache in (cache_asks, cache_bids):
+        for key, data in cache.items():
+            if not data:
+                cache[key] = None
+                continue
+            # quantiles() needs at least two samples; a single sample is its own range.
+            if len(data) == 1:
+                cache[key] = (data[0], data[0])
+                continue
+            deciles = statistics.quantiles(data, n=10, method='inclusive')
+            cache[key] = (deciles[0], deciles[-1])
     return (cache_asks, cache_bids)
     
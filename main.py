@@ -1,10 +1,10 @@
 import logging
 import time
 
-from collections import deque
+from dataclasses import dataclass
 from optibook import ORDER_TYPE_IOC, SIDE_ASK, SIDE_BID
 from optibook.synchronous_client import Exchange
-from helper import is_up,clear_all_stock
+from helper import INSTRUMENT_IDS, is_up, clear_stock
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -16,23 +16,29 @@ ETF_US_ID = 'SEMIS_ETF_US'
 ASML_ID = 'ASML'
 AMD_ID = 'AMD'
 NVDA_ID = 'NVDA'
+UNDERLYING_IDS = (ASML_ID, AMD_ID, NVDA_ID)
 
 THRESHOLD = 0.05
 BASKET_THRESHOLD = 10
+INV3 = 1.0 / 3.0
 
 MAX_POSITION = 750
-INSTRUMENT_IDS = ['SEMIS_ETF_US', 'SEMIS_ETF_EU', 'NVDA', 'AMD', 'ASML']
+# Direction in which an order moves our position.
+SIDE_SIGN = {SIDE_BID: 1, SIDE_ASK: -1}
 
 GRID_THRESHOLD_DEFAULT = 0.2
-def get_dynamic_grid_threshold(e):
+def basket_position(positions) -> int:
+    """
+    Return the combined position of ETF_US, ETF_EU, ASML, AMD and NVDA.
+    """
+    return sum(positions.get(instrument, 0) for instrument in INSTRUMENT_IDS)
+
+def get_dynamic_grid_threshold(basket):
     """
     Return a dynamic grid threshold.
     If the combined basket position is near its limit (e.g. > 80% of 300),
     then the threshold is halved to clean up positions faster.
     """
-    pos = e.get_positions()
-    basket = (pos.get(ETF_US_ID, 0) + pos.get(ETF_EU_ID, 0) +
-              pos.get(ASML_ID, 0) + pos.get(AMD_ID, 0) + pos.get(NVDA_ID, 0))
     if abs(basket) > 0.8 * 300:  # i.e. if basket exceeds 240 or is below -240
         return GRID_THRESHOLD / 2  # more aggressive grid: 0.1 instead of 0.2
     return GRID_THRESHOLD
@@ -41,12 +47,60 @@ GRID_THRESHOLD = GRID_THRESHOLD_DEFAULT  # This may be dynamically lowered.
 BASKET_LOWER_LIMIT = -300
 BASKET_UPPER_LIMIT = 300
 
-position_queues = {''
-    ETF_US_ID: {'long': deque(), 'short': deque()},
-    ETF_EU_ID: {'long': deque(), 'short': deque()},
-    ASML_ID: {'long': deque(), 'short': deque()},
-    AMD_ID: {'long': deque(), 'short': deque()},
-    NVDA_ID: {'long': deque(), 'short': deque()}
+@dataclass(slots=True)
+class Lot:
+    """An open entry in a position queue; volume shrinks in place as it is offset."""
+    price: float
+    volume: int
+
+class LotQueue:
+    """
+    FIFO of Lots stored in a ring of preallocated, reused Lot objects, so that
+    recording trades does not allocate once the ring is large enough.
+    The ring doubles in size when it is full.
+    """
+    __slots__ = ('lots', 'head', 'size')
+
+    def __init__(self, capacity: int = 64):
+        self.lots = [Lot(0.0, 0) for _ in range(capacity)]
+        self.head = 0
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def peek(self) -> Lot:
+        """Return the oldest Lot. It is reused once popped, so read it before calling popleft()."""
+        if self.size == 0:
+            raise IndexError('peek from an empty LotQueue')
+        return self.lots[self.head]
+
+    def popleft(self):
+        if self.size == 0:
+            raise IndexError('pop from an empty LotQueue')
+        self.head = (self.head + 1) % len(self.lots)
+        self.size -= 1
+
+    def append(self, price: float, volume: int):
+        lots = self.lots
+        capacity = len(lots)
+        if self.size == capacity:
+            # Unroll the ring so the oldest Lot comes first, then double it.
+            lots = lots[self.head:] + lots[:self.head] + [Lot(0.0, 0) for _ in range(capacity)]
+            self.lots = lots
+            self.head = 0
+            capacity *= 2
+        lot = lots[(self.head + self.size) % capacity]
+        lot.price = price
+        lot.volume = volume
+        self.size += 1
+
+position_queues = {
+    ETF_US_ID: {'long': LotQueue(), 'short': LotQueue()},
+    ETF_EU_ID: {'long': LotQueue(), 'short': LotQueue()},
+    ASML_ID: {'long': LotQueue(), 'short': LotQueue()},
+    AMD_ID: {'long': LotQueue(), 'short': LotQueue()},
+    NVDA_ID: {'long': LotQueue(), 'short': LotQueue()}
 }
 
 # Global counters (optional) for tracking trade events.
@@ -54,17 +108,15 @@ arbitrage_counter = 0
 reverse_arbitrage_counter = 0
 basket_violation_start_time = None
 
-def check_and_correct_basket_limit(e):
+def check_and_correct_basket_limit(e, books, positions, basket):
     """
     Enforce the basket position limit.
     The basket (combined position of ETF_US, ETF_EU, ASML, AMD, NVDA)
-    must lie between -300 and 300. If this is breached for more than 3 seconds,
-    issue corrective orders (distributed evenly over the 5 instruments).
+    must lie between -300 and 300. To stay clear of that limit, once the basket
+    has been outside -250..250 for more than 2.5 seconds, issue corrective orders
+    that bring it back to the band (distributed evenly over the 5 instruments).
     """
     global basket_violation_start_time
-    pos = e.get_positions()
-    basket = (pos.get(ETF_US_ID, 0) + pos.get(ETF_EU_ID, 0) +
-              pos.get(ASML_ID, 0) + pos.get(AMD_ID, 0) + pos.get(NVDA_ID, 0))
     
     # If within limits, reset the violation timer.
     if -250 <= basket <= 250:
@@ -75,37 +127,64 @@ def check_and_correct_basket_limit(e):
     if basket_violation_start_time is None:
         basket_violation_start_time = time.time()
     elif time.time() - basket_violation_start_time > 2.5:
-        # We have been out-of-bound for more than 3 seconds: force correction.
-        if basket > 300:
-            excess = basket - 250
-            # Distribute corrective sell orders evenly over the 5 instruments.
-            trade_volume = excess // 5 + 1  # round up
-            for instrument in INSTRUMENT_IDS:
-                current = pos.get(instrument, 0)
-                if current > 0:
-                    volume_to_sell = min(current, trade_volume)
-                    pb = e.get_last_price_book(instrument)
-                    if pb and pb.bids:
-                        sell_price = pb.bids[0].price
-                        e.insert_order(instrument, price=sell_price, volume=volume_to_sell,
-                                       side=SIDE_ASK, order_type=ORDER_TYPE_IOC)
-                        logger.info(f"[Basket Correction] Forced sell of {volume_to_sell} {instrument} at {sell_price}")
-        elif basket < -300:
-            excess = -250 - basket
-            trade_volume = excess // 5 + 1
-            for instrument in INSTRUMENT_IDS:
-                current = pos.get(instrument, 0)
-                if current < 0:
-                    pb = e.get_last_price_book(instrument)
-                    if pb and pb.asks:
-                        buy_price = pb.asks[0].price
-                        volume_to_buy = min(abs(current), trade_volume)
-                        e.insert_order(instrument, price=buy_price, volume=volume_to_buy,
-                                       side=SIDE_BID, order_type=ORDER_TYPE_IOC)
-                        logger.info(f"[Basket Correction] Forced buy of {volume_to_buy} {instrument} at {buy_price}")
+        # We have been out-of-bound for more than 2.5 seconds: force correction.
+        # A long basket is reduced by selling long positions, a short one by buying back short positions.
+        direction = 1 if basket > 250 else -1
+        side = SIDE_ASK if direction == 1 else SIDE_BID
+        excess = abs(basket) - 250
+        # Distribute corrective orders evenly over the 5 instruments.
+        trade_volume = excess // 5 + 1  # round up
+        for instrument in INSTRUMENT_IDS:
+            current = positions.get(instrument, 0)
+            if current * direction <= 0:
+                continue
+            pb = books[instrument]
+            levels = (pb.bids if side == SIDE_ASK else pb.asks) if pb else None
+            if levels:
+                price = levels[0].price
+                volume = min(abs(current), trade_volume)
+                insert_ioc_order(e, positions, instrument, price, volume, side)
+                logger.info("[Basket Correction] Forced %s of %s %s at %s",
+                            "sell" if side == SIDE_ASK else "buy", volume, instrument, price)
         # After issuing corrective trades, reset the violation timer.
         basket_violation_start_time = None
 
+def apply_expected_fill(positions, instrument: str, side: str, volume: int):
+    """
+    Update the cycle's position snapshot as if the order was filled in full.
+    IOC orders may only be partially filled, so the snapshot can drift until
+    it is refreshed at the start of the next cycle.
+    """
+    if side == SIDE_BID:
+        positions[instrument] = positions.get(instrument, 0) + volume
+    elif side == SIDE_ASK:
+        positions[instrument] = positions.get(instrument, 0) - volume
+
+def insert_ioc_order(e: Exchange, positions, instrument: str, price: float, volume: int, side: str):
+    """
+    Insert an IOC order and, if accepted, apply it to the position snapshot.
+    """
+    response = e.insert_order(instrument, price=price, volume=volume,
+                              side=side, order_type=ORDER_TYPE_IOC)
+    if response.success:
+        apply_expected_fill(positions, instrument, side, volume)
+    return response
+
+def insert_ioc_orders(e: Exchange, positions, orders):
+    """
+    Insert several IOC orders, one per (instrument, price, volume, side) tuple.
+    Returns the responses in the same order.
+    """
+    return [insert_ioc_order(e, positions, *order) for order in orders]
+
+def record_trades(orders, responses):
+    """
+    Record the legs of a batch that were accepted by the exchange.
+    """
+    for (instrument, price, volume, side), response in zip(orders, responses):
+        if response.success:
+            record_trade(instrument, side, price, volume)
+
 def record_trade(instrument: str, side: str, price: float, volume: int):
     """
     Record an executed trade for auto-calibration.
@@ -115,66 +194,64 @@ def record_trade(instrument: str, side: str, price: float, volume: int):
     
     If there are existing positions on the opposite side, offset them first (FIFO).
     """
+    queues = position_queues[instrument]
     if side == SIDE_BID:
-        # A buy order offsets any existing short entries first.
-        while volume > 0 and position_queues[instrument]['short']:
-            entry_price, entry_vol = position_queues[instrument]['short'][0]
-            if entry_vol <= volume:
-                volume -= entry_vol
-                position_queues[instrument]['short'].popleft()
-            else:
-                position_queues[instrument]['short'][0] = (entry_price, entry_vol - volume)
-                volume = 0
-        if volume > 0:
-            # Any remaining volume is recorded as a long position.
-            position_queues[instrument]['long'].append((price, volume))
+        # A buy order offsets any existing short entries first;
+        # any remaining volume is recorded as a long position.
+        offset, opened = queues['short'], queues['long']
     elif side == SIDE_ASK:
-        # A sell order offsets any existing long entries first.
-        while volume > 0 and position_queues[instrument]['long']:
-            entry_price, entry_vol = position_queues[instrument]['long'][0]
-            if entry_vol <= volume:
-                volume -= entry_vol
-                position_queues[instrument]['long'].popleft()
-            else:
-                position_queues[instrument]['long'][0] = (entry_price, entry_vol - volume)
-                volume = 0
-        if volume > 0:
-            # Any remaining volume is recorded as a short position.
-            position_queues[instrument]['short'].append((price, volume))
-
-def auto_calibrate_positions(e):
+        # A sell order offsets any existing long entries first;
+        # any remaining volume is recorded as a short position.
+        offset, opened = queues['long'], queues['short']
+    else:
+        return
+    while volume > 0 and offset:
+        entry = offset.peek()
+        if entry.volume <= volume:
+            volume -= entry.volume
+            offset.popleft()
+        else:
+            entry.volume -= volume
+            volume = 0
+    if volume > 0:
+        opened.append(price, volume)
+
+def auto_calibrate_positions(e, books, positions, basket):
+    # The threshold only depends on the basket, so it is the same for every instrument.
+    dyn_threshold = get_dynamic_grid_threshold(basket)
     for instrument, queues in position_queues.items():
-        pb = e.get_last_price_book(instrument)
+        pb = books[instrument]
         if not pb:
             continue
-        dyn_threshold = get_dynamic_grid_threshold(e)
+        long_queue = queues['long']
+        short_queue = queues['short']
         # For long entries:
-        if pb.bids:
+        if pb.bids and long_queue:
             current_bid = pb.bids[0].price
-            while queues['long']:
-                entry_price, volume = queues['long'][0]
+            while long_queue:
+                entry = long_queue.peek()
+                entry_price, volume = entry.price, entry.volume
                 if current_bid > (entry_price + dyn_threshold):
-                    e.insert_order(instrument, price=current_bid, volume=volume,
-                                   side=SIDE_ASK, order_type=ORDER_TYPE_IOC)
-                    logger.info(f"[Auto Calibrate] Sold {volume} of {instrument} at {current_bid} (entry {entry_price})")
-                    queues['long'].popleft()
+                    insert_ioc_order(e, positions, instrument, current_bid, volume, SIDE_ASK)
+                    logger.debug("[Auto Calibrate] Sold %s of %s at %s (entry %s)", volume, instrument, current_bid, entry_price)
+                    long_queue.popleft()
                 else:
                     break
         # For short entries:
-        if pb.asks:
+        if pb.asks and short_queue:
             current_ask = pb.asks[0].price
-            while queues['short']:
-                entry_price, volume = queues['short'][0]
+            while short_queue:
+                entry = short_queue.peek()
+                entry_price, volume = entry.price, entry.volume
                 if current_ask < (entry_price - dyn_threshold):
-                    e.insert_order(instrument, price=current_ask, volume=volume,
-                                   side=SIDE_BID, order_type=ORDER_TYPE_IOC)
-                    logger.info(f"[Auto Calibrate] Bought {volume} of {instrument} at {current_ask} (entry {entry_price})")
-                    queues['short'].popleft()
+                    insert_ioc_order(e, positions, instrument, current_ask, volume, SIDE_BID)
+                    logger.debug("[Auto Calibrate] Bought %s of %s at %s (entry %s)", volume, instrument, current_ask, entry_price)
+                    short_queue.popleft()
                 else:
                     break
 
 
-def risk_allowed(e: Exchange, instrument: str, side: str) -> int:
+def risk_allowed(positions, instrument: str, side: str) -> int:
     """
     Returns the maximum volume allowed by risk management for a given instrument and order side.
     
@@ -188,129 +265,123 @@ def risk_allowed(e: Exchange, instrument: str, side: str) -> int:
     
     If the allowed volume is <= 0, then no trade should be executed.
     """
-    pos = e.get_positions().get(instrument, 0)
-    if side == SIDE_BID:  # Buying increases position.
-        allowed = MAX_POSITION - pos
-    elif side == SIDE_ASK:  # Selling decreases position (or increases short).
-        allowed = MAX_POSITION + pos
-    else:
-        allowed = 0
-    return max(allowed, 0)
+    sign = SIDE_SIGN.get(side)
+    if sign is None:
+        return 0
+    return max(MAX_POSITION - sign * positions.get(instrument, 0), 0)
 
 
-def arbitrage_strategy(e: Exchange, threshold=THRESHOLD):
+def etf_spread_arbitrage(e: Exchange, books, positions, sell_id: str, buy_id: str,
+                         threshold: float, label: str, counter: int) -> int:
     """
-    Normal arbitrage between ETFs:
-    If US ETF bid > (EU ETF ask + threshold), then execute:
-      - Sell US ETF at its bid price (IOC)
-      - Buy EU ETF at its ask price (IOC)
+    Arbitrage between the two ETFs:
+    If the sell_id ETF bid > (buy_id ETF ask + threshold), then execute:
+      - Sell the sell_id ETF at its bid price (IOC)
+      - Buy the buy_id ETF at its ask price (IOC)
+    label and counter identify the trade in the log.
+    Returns the counter, incremented if the trade was executed.
     """
-    global arbitrage_counter
-    etf_us = e.get_last_price_book(ETF_US_ID)
-    etf_eu = e.get_last_price_book(ETF_EU_ID)
+    sell_book = books[sell_id]
+    buy_book = books[buy_id]
 
     # Check that both price books are valid and contain orders.
-    if not (is_up(etf_us) and is_up(etf_eu)):
-        return
-    if not (etf_us.bids and etf_eu.asks):
-        return
-
-    bid_price_us = etf_us.bids[0].price
-    ask_price_eu = etf_eu.asks[0].price
-    if bid_price_us > (ask_price_eu + threshold):
-        # Determine the maximum volume available for arbitrage.
-        order_volume = min(etf_us.bids[0].volume, etf_eu.asks[0].volume)
-        allowed_sell_us = risk_allowed(e, ETF_US_ID, SIDE_ASK)  # For selling US ETF.
-        allowed_buy_eu = risk_allowed(e, ETF_EU_ID, SIDE_BID)     # For buying EU ETF.
-        volume = min(order_volume, allowed_sell_us, allowed_buy_eu)
-
-        # Execute orders:
-        if volume > 0:
-            e.insert_order(ETF_US_ID, price=bid_price_us, volume=volume,
-                        side=SIDE_ASK, order_type=ORDER_TYPE_IOC)
-            e.insert_order(ETF_EU_ID, price=ask_price_eu, volume=volume,
-                        side=SIDE_BID, order_type=ORDER_TYPE_IOC)
-            
-            arbitrage_counter += 1
-            record_trade(ETF_US_ID, SIDE_ASK, bid_price_us, volume)
-            record_trade(ETF_EU_ID, SIDE_BID, ask_price_eu, volume)
-            logger.info(f"[Arbitrage #{arbitrage_counter}] Sold {volume} of {ETF_US_ID} at {bid_price_us} and "
-                        f"bought {volume} of {ETF_EU_ID} at {ask_price_eu}")
-        else:
-            logger.debug("Arbitrage strategy: risk limits prevent trade execution.")
+    if not (is_up(sell_book) and is_up(buy_book)):
+        return counter
+
+    sell_bid = sell_book.bids[0]
+    buy_ask = buy_book.asks[0]
+    bid_price = sell_bid.price
+    ask_price = buy_ask.price
+    if bid_price <= (ask_price + threshold):
+        return counter
+
+    # Determine the maximum volume available for arbitrage.
+    order_volume = min(sell_bid.volume, buy_ask.volume)
+    allowed_sell = risk_allowed(positions, sell_id, SIDE_ASK)
+    allowed_buy = risk_allowed(positions, buy_id, SIDE_BID)
+    volume = min(order_volume, allowed_sell, allowed_buy)
+    if volume <= 0:
+        logger.debug("%s strategy: risk limits prevent trade execution.", label)
+        return counter
+
+    # Execute orders:
+    orders = [
+        (sell_id, bid_price, volume, SIDE_ASK),
+        (buy_id, ask_price, volume, SIDE_BID),
+    ]
+    responses = insert_ioc_orders(e, positions, orders)
+    counter += 1
+    record_trades(orders, responses)
+    logger.info("[%s #%s] Sold %s of %s at %s and bought %s of %s at %s",
+                label, counter, volume, sell_id, bid_price, volume, buy_id, ask_price)
+    return counter
+
+def arbitrage_strategy(e: Exchange, books, positions, threshold=THRESHOLD):
+    """
+    Normal arbitrage between ETFs: sell the US ETF and buy the EU ETF
+    when the US bid exceeds the EU ask by more than threshold.
+    """
+    global arbitrage_counter
+    arbitrage_counter = etf_spread_arbitrage(e, books, positions, ETF_US_ID, ETF_EU_ID, threshold,
+                                             "Arbitrage", arbitrage_counter)
 
-def reverse_arbitrage_strategy(e: Exchange, threshold=THRESHOLD):
+def reverse_arbitrage_strategy(e: Exchange, books, positions, threshold=THRESHOLD):
     """
-    Reverse arbitrage between ETFs:
-    If EU ETF bid > (US ETF ask + threshold), then execute:
-      - Sell EU ETF at its bid price (IOC)
-      - Buy US ETF at its ask price (IOC)
+    Reverse arbitrage between ETFs: sell the EU ETF and buy the US ETF
+    when the EU bid exceeds the US ask by more than threshold.
     """
     global reverse_arbitrage_counter
-    etf_us = e.get_last_price_book(ETF_US_ID)
-    etf_eu = e.get_last_price_book(ETF_EU_ID)
-
-    if not (is_up(etf_us) and is_up(etf_eu)):
-        return
-    if not (etf_eu.bids and etf_us.asks):
-        return
-
-    bid_price_eu = etf_eu.bids[0].price
-    ask_price_us = etf_us.asks[0].price
-
-    if bid_price_eu > (ask_price_us + threshold):
-        order_volume  = min(etf_eu.bids[0].volume, etf_us.asks[0].volume)
-        allowed_sell_eu = risk_allowed(e, ETF_EU_ID, SIDE_ASK)  # For selling EU ETF.
-        allowed_buy_us = risk_allowed(e, ETF_US_ID, SIDE_BID)     # For buying US ETF.
-        volume = min(order_volume, allowed_sell_eu, allowed_buy_us)
-        
-        if volume > 0:
-            e.insert_order(ETF_EU_ID, price=bid_price_eu, volume=volume,
-                        side=SIDE_ASK, order_type=ORDER_TYPE_IOC)
-            e.insert_order(ETF_US_ID, price=ask_price_us, volume=volume,
-                        side=SIDE_BID, order_type=ORDER_TYPE_IOC)
-            reverse_arbitrage_counter += 1
-            record_trade(ETF_EU_ID, SIDE_ASK, bid_price_eu, volume)
-            record_trade(ETF_US_ID, SIDE_BID, ask_price_us, volume)
-            logger.info(f"[Reverse Arbitrage #{reverse_arbitrage_counter}] Sold {volume} of {ETF_EU_ID} at {bid_price_eu} and "
-                        f"bought {volume} of {ETF_US_ID} at {ask_price_us}")
-        else:
-            logger.debug("Reverse arbitrage strategy: risk limits prevent trade execution.")
-
-# --- Global Variables for Last Known Underlying Prices ---
-last_asml_bid = 0.0
-last_amd_bid  = 0.0
-last_nvda_bid = 0.0
+    reverse_arbitrage_counter = etf_spread_arbitrage(e, books, positions, ETF_EU_ID, ETF_US_ID, threshold,
+                                                     "Reverse Arbitrage", reverse_arbitrage_counter)
 
-last_asml_ask = 0.0
-last_amd_ask = 0.0
-last_nvda_ask = 0.0
+# --- Last Known Underlying Prices ---
+last_bid = {instrument: 0.0 for instrument in UNDERLYING_IDS}
+last_ask = {instrument: 0.0 for instrument in UNDERLYING_IDS}
 
 # --- Update Underlying Prices ---
-def update_underlying_prices(e):
-    """
-    Update global variables with the latest available prices for ASML, AMD, and NVDA.
-    If the current price book is missing bid data, the previous value is retained.
-    """
-    global last_asml_bid, last_amd_bid, last_nvda_bid, last_asml_ask, last_amd_ask, last_nvda_ask
-    asml_pb = e.get_last_price_book(ASML_ID)
-    amd_pb  = e.get_last_price_book(AMD_ID)
-    nvda_pb = e.get_last_price_book(NVDA_ID)
-    if asml_pb and asml_pb.bids:
-        last_asml_bid = asml_pb.bids[0].price
-    if amd_pb and amd_pb.bids:
-        last_amd_bid = amd_pb.bids[0].price
-    if nvda_pb and nvda_pb.bids:
-        last_nvda_bid = nvda_pb.bids[0].price
-    if asml_pb and asml_pb.asks:
-        last_asml_ask = asml_pb.asks[0].price
-    if amd_pb and amd_pb.asks:
-        last_amd_ask = amd_pb.asks[0].price
-    if nvda_pb and nvda_pb.asks:
-        last_nvda_ask = nvda_pb.asks[0].price
+def update_underlying_prices(books):
+    """
+    Update last_bid and last_ask with the latest available prices for ASML, AMD, and NVDA.
+    If the current price book is missing bid or ask data, the previous value is retained.
+    """
+    for instrument in UNDERLYING_IDS:
+        pb = books[instrument]
+        if not pb:
+            continue
+        if pb.bids:
+            last_bid[instrument] = pb.bids[0].price
+        if pb.asks:
+            last_ask[instrument] = pb.asks[0].price
+
+def execute_hedge(e: Exchange, positions, etf_side: str, etf_level, underlying_levels) -> int:
+    """
+    Trade ETF_US on etf_side against the opposite side of ASML, AMD and NVDA.
+    etf_level is the ETF_US price level we trade against and underlying_levels
+    the matching levels of the underlying stocks, in UNDERLYING_IDS order.
+    
+    The volume is limited by the order books, by risk management and to 10 per
+    leg; three ETFs are traded per unit of each underlying stock.
+    Returns the volume traded per underlying stock (0 if nothing was traded).
+    """
+    underlying_side = SIDE_ASK if etf_side == SIDE_BID else SIDE_BID
+    allowed_volume = min(
+        etf_level.volume // 3,
+        *(level.volume for level in underlying_levels),
+        10,
+        risk_allowed(positions, ETF_US_ID, etf_side),
+        *(risk_allowed(positions, instrument, underlying_side) for instrument in UNDERLYING_IDS)
+    )
+    if allowed_volume <= 0:
+        return 0
+    orders = [(ETF_US_ID, etf_level.price, allowed_volume * 3, etf_side)]
+    orders += [(instrument, level.price, allowed_volume, underlying_side)
+               for instrument, level in zip(UNDERLYING_IDS, underlying_levels)]
+    responses = insert_ioc_orders(e, positions, orders)
+    record_trades(orders, responses)
+    return allowed_volume
 
 # --- Hedge Basket Strategy ---
-def hedge_basket_strategy(e):
+def hedge_basket_strategy(e, books, positions):
     """
     Hedge the basket so that:
       SEMIS_ETF_US = (ASML + NVDA + AMD)/3.
@@ -325,109 +396,105 @@ def hedge_basket_strategy(e):
     The allowed volumes are constrained by our risk management.
     """
     # Update the underlying prices so we have a fallback in case of market close.
-    update_underlying_prices(e)
+    update_underlying_prices(books)
 
-    # Retrieve live price books.
-    etf_us = e.get_last_price_book(ETF_US_ID)
-    asml   = e.get_last_price_book(ASML_ID)
-    amd    = e.get_last_price_book(AMD_ID)
-    nvda   = e.get_last_price_book(NVDA_ID)
-    
-    # Ensure that all necessary price books are available.
-    if not (etf_us and asml and amd and nvda):
-        return
-    if not (etf_us.bids and etf_us.asks and asml.bids and asml.asks and
-            amd.bids and amd.asks and nvda.bids and nvda.asks):
+    etf_us = books[ETF_US_ID]
+    if not (etf_us and etf_us.bids and etf_us.asks):
         return
 
     # Compute the average underlying price using the last known prices.
-    avg_underlying_bid = (last_asml_bid + last_amd_bid + last_nvda_bid) / 3.0
-    avg_underlying_ask = (last_asml_ask + last_amd_ask + last_nvda_ask) / 3.0
+    avg_underlying_bid = sum(last_bid.values()) * INV3
+    avg_underlying_ask = sum(last_ask.values()) * INV3
 
     # Use ETF_US's mid price as the reference.
-    etf_bid = etf_us.bids[0].price
-    etf_ask = etf_us.asks[0].price
+    etf_bid0 = etf_us.bids[0]
+    etf_ask0 = etf_us.asks[0]
+
+    # Check the cheap ETF-only condition first: most cycles end here.
+    undervalued = etf_ask0.price < (avg_underlying_bid - BASKET_THRESHOLD)
+    if not undervalued and etf_bid0.price <= (avg_underlying_ask + BASKET_THRESHOLD):
+        return
+
+    # Ensure that the underlying price books are available to trade against.
+    asml   = books[ASML_ID]
+    amd    = books[AMD_ID]
+    nvda   = books[NVDA_ID]
+    if not (asml and amd and nvda):
+        return
+    if not (asml.bids and asml.asks and amd.bids and amd.asks and nvda.bids and nvda.asks):
+        return
 
     # --- Case 1: ETF appears undervalued ---
-    if etf_ask < (avg_underlying_bid - BASKET_THRESHOLD):
+    if undervalued:
         # We want to buy ETF (at its ask) and sell underlying stocks (at their bids).
-        # Determine available volume from the order books:
-        volume = min(
-            etf_us.asks[0].volume // 3,
-            asml.bids[0].volume,
-            amd.bids[0].volume,
-            nvda.bids[0].volume,
-            10
-        )
-        # Apply risk management:
-        allowed_buy_etf  = risk_allowed(e, ETF_US_ID, SIDE_BID)
-        allowed_sell_asml = risk_allowed(e, ASML_ID, SIDE_ASK)
-        allowed_sell_amd  = risk_allowed(e, AMD_ID, SIDE_ASK)
-        allowed_sell_nvda = risk_allowed(e, NVDA_ID, SIDE_ASK)
-        allowed_volume = min(volume, allowed_buy_etf, allowed_sell_asml, allowed_sell_amd, allowed_sell_nvda)
-        if allowed_volume > 0:
-            # Execute hedge orders.
-            e.insert_order(ETF_US_ID, price=etf_us.asks[0].price, volume=allowed_volume * 3,
-                           side=SIDE_BID, order_type=ORDER_TYPE_IOC)
-            e.insert_order(ASML_ID, price=asml.bids[0].price, volume=allowed_volume,
-                           side=SIDE_ASK, order_type=ORDER_TYPE_IOC)
-            e.insert_order(AMD_ID, price=amd.bids[0].price, volume=allowed_volume,
-                           side=SIDE_ASK, order_type=ORDER_TYPE_IOC)
-            e.insert_order(NVDA_ID, price=nvda.bids[0].price, volume=allowed_volume,
-                           side=SIDE_ASK, order_type=ORDER_TYPE_IOC)
-            record_trade(ETF_US_ID, SIDE_BID, etf_us.asks[0].price, allowed_volume * 3)
-            record_trade(ASML_ID, SIDE_ASK, asml.bids[0].price, allowed_volume)
-            record_trade(AMD_ID, SIDE_ASK, amd.bids[0].price, allowed_volume)
-            record_trade(NVDA_ID, SIDE_ASK, nvda.bids[0].price, allowed_volume)
-            logger.info(f"[Hedge] ETF undervalued (Underlying-value: {avg_underlying_bid}): Bought {allowed_volume * 3} of {ETF_US_ID} at {etf_us.asks[0].price} "
-                        f"and sold underlying stocks at {asml.bids[0].price}, {amd.bids[0].price}, {nvda.bids[0].price}")
+        underlying = (asml.bids[0], amd.bids[0], nvda.bids[0])
+        allowed_volume = execute_hedge(e, positions, SIDE_BID, etf_ask0, underlying)
+        if allowed_volume > 0 and logger.isEnabledFor(logging.INFO):
+            logger.info("[Hedge] ETF undervalued (Underlying-value: %s): Bought %s of %s at %s "
+                        "and sold underlying stocks at %s, %s, %s",
+                        avg_underlying_bid, allowed_volume * 3, ETF_US_ID, etf_ask0.price,
+                        underlying[0].price, underlying[1].price, underlying[2].price)
     
     # --- Case 2: ETF appears overvalued ---
-    elif etf_bid > (avg_underlying_ask + BASKET_THRESHOLD):
+    else:
         # We want to sell ETF (at its bid) and buy underlying stocks (at their asks).
-        volume = min(
-            etf_us.bids[0].volume // 3,
-            asml.asks[0].volume,
-            amd.asks[0].volume,
-            nvda.asks[0].volume,
-            10
-        )
-        allowed_sell_etf = risk_allowed(e, ETF_US_ID, SIDE_ASK)
-        allowed_buy_asml  = risk_allowed(e, ASML_ID, SIDE_BID)
-        allowed_buy_amd   = risk_allowed(e, AMD_ID, SIDE_BID)
-        allowed_buy_nvda  = risk_allowed(e, NVDA_ID, SIDE_BID)
-        allowed_volume = min(volume, allowed_sell_etf, allowed_buy_asml, allowed_buy_amd, allowed_buy_nvda)
-        if allowed_volume > 0:
-            e.insert_order(ETF_US_ID, price=etf_us.bids[0].price, volume=allowed_volume * 3,
-                           side=SIDE_ASK, order_type=ORDER_TYPE_IOC)
-            e.insert_order(ASML_ID, price=asml.asks[0].price, volume=allowed_volume,
-                           side=SIDE_BID, order_type=ORDER_TYPE_IOC)
-            e.insert_order(AMD_ID, price=amd.asks[0].price, volume=allowed_volume,
-                           side=SIDE_BID, order_type=ORDER_TYPE_IOC)
-            e.insert_order(NVDA_ID, price=nvda.asks[0].price, volume=allowed_volume,
-                           side=SIDE_BID, order_type=ORDER_TYPE_IOC)
-            record_trade(ETF_US_ID, SIDE_ASK, etf_us.bids[0].price, allowed_volume * 3)
-            record_trade(ASML_ID, SIDE_BID, asml.asks[0].price, allowed_volume)
-            record_trade(AMD_ID, SIDE_BID, amd.asks[0].price, allowed_volume)
-            record_trade(NVDA_ID, SIDE_BID, nvda.asks[0].price, allowed_volume)
-            logger.info(f"[Hedge] ETF overvalued (Underlying value: {avg_underlying_ask}): Sold {allowed_volume * 3} of {ETF_US_ID} at {etf_us.bids[0].price} "
-                        f"and bought underlying stocks at {asml.asks[0].price}, {amd.asks[0].price}, {nvda.asks[0].price}")
+        underlying = (asml.asks[0], amd.asks[0], nvda.asks[0])
+        allowed_volume = execute_hedge(e, positions, SIDE_ASK, etf_bid0, underlying)
+        if allowed_volume > 0 and logger.isEnabledFor(logging.INFO):
+            logger.info("[Hedge] ETF overvalued (Underlying value: %s): Sold %s of %s at %s "
+                        "and bought underlying stocks at %s, %s, %s",
+                        avg_underlying_ask, allowed_volume * 3, ETF_US_ID, etf_bid0.price,
+                        underlying[0].price, underlying[1].price, underlying[2].price)
+
+
+# --- Market Data Change Detection ---
+HEARTBEAT_SEC = 1.0
+last_top_of_book = None
+last_full_cycle_time = 0.0
 
+def top_of_book(pb):
+    """
+    Return the best bid and ask of a price book as ((price, volume), (price, volume)),
+    with None for a missing book or side.
+    """
+    if not pb:
+        return None
+    best_bid = (pb.bids[0].price, pb.bids[0].volume) if pb.bids else None
+    best_ask = (pb.asks[0].price, pb.asks[0].volume) if pb.asks else None
+    return (best_bid, best_ask)
 
 def trade_cycle(e: Exchange):
     """
     Run the arbitrage strategies.
+    Price books are fetched once per cycle and shared by all strategies.
+    The strategies only run when the top of any book has moved since they last ran,
+    or at least every HEARTBEAT_SEC so that time-based checks still fire in a quiet market.
+    Positions are fetched once per cycle and kept up to date locally as orders are inserted.
     """
-    hedge_basket_strategy(e)
-    arbitrage_strategy(e)
-    reverse_arbitrage_strategy(e)
-    auto_calibrate_positions(e)
-    check_and_correct_basket_limit(e)
+    global last_top_of_book, last_full_cycle_time
+    books = {instrument: e.get_last_price_book(instrument) for instrument in INSTRUMENT_IDS}
+    current_top_of_book = tuple(top_of_book(books[instrument]) for instrument in INSTRUMENT_IDS)
+    now = time.monotonic()
+    if current_top_of_book == last_top_of_book and now - last_full_cycle_time < HEARTBEAT_SEC:
+        return
+    last_top_of_book = current_top_of_book
+    last_full_cycle_time = now
+
+    # Copy the positions, since the snapshot is updated in place as orders are inserted.
+    positions = dict(e.get_positions())
+    hedge_basket_strategy(e, books, positions)
+    arbitrage_strategy(e, books, positions)
+    reverse_arbitrage_strategy(e, books, positions)
+    auto_calibrate_positions(e, books, positions, basket_position(positions))
+    # Auto-calibration trades change the basket, so it is recomputed for the limit check.
+    check_and_correct_basket_limit(e, books, positions, basket_position(positions))
     
 
 def start():
     """
     Connect to the exchange, clear any stale orders, and repeatedly run the trading cycle.
+    Cycles start on a fixed period measured from the previous start, so the time spent
+    trading is not added on top of the wait.
     """
     exchange = Exchange()
     exchange.connect()
@@ -436,15 +503,23 @@ def start():
     exchange.delete_orders(ETF_US_ID)
     exchange.delete_orders(ETF_EU_ID)
 
-    sleep_duration_sec = 0.05  # Adjust as necessary.
+    cycle_period_sec = 0.05  # Adjust as necessary.
 
     for id in INSTRUMENT_IDS:
         exchange.delete_orders(id)
-    clear_all_stock(exchange)
+    clear_stock(exchange)
     print(exchange.get_positions())
+    next_tick = time.monotonic()
     while True:
         trade_cycle(exchange)
-        time.sleep(sleep_duration_sec)
+        next_tick += cycle_period_sec
+        delay = next_tick - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # The cycle overran its budget: start the next one straight away.
+            logger.warning("Trade cycle missed its deadline by %.1f ms", -delay * 1000)
+            next_tick = time.monotonic()
 
 if __name__ == '__main__':
     start()